@@ -1,6 +1,7 @@
+import functools
 import os
 import sys
-from typing import Any, List, Optional
+from typing import Any, Callable, Iterable, List, Optional
 
 from albert import Action, Icon, PluginInstance, StandardIconType, StandardItem, TriggerQueryHandler, makeStandardIcon
 
@@ -44,6 +45,55 @@ ICONS = {
     "stop": "xdg:media-playback-stop-symbolic",
     "error": "xdg:dialog-error-symbolic",
 }
+ICON_LISTS = {name: [icon] for name, icon in ICONS.items()}
+Command = tuple[str, str, Any, List[str]]  # (text, subtext, action, icons)
+COMMANDS = ["info", "play", "pause", "next", "prev", "shuffle", "loop", "goto", "switch"]
+# Commands whose text does not depend on the player state: (text, subtext, icons)
+STATIC_COMMANDS = {
+    "play": ("Play", "Play current track", ICON_LISTS["play"]),
+    "pause": ("Pause", "Pause current track", ICON_LISTS["pause"]),
+    "next": ("Next", "Go to next track", ICON_LISTS["next"]),
+    "prev": ("Previous", "Go to previous track", ICON_LISTS["previous"]),
+    # "stop": ("Stop", "Stop playback", ICON_LISTS["stop"]),
+}
+
+
+class PrefixTrie:
+    """Character trie to look up keys by prefix without scanning all of them"""
+
+    def __init__(self, keys: Iterable[str] = ()) -> None:
+        self._root: dict[str, Any] = {}
+        for key in keys:
+            self.add(key)
+
+    def add(self, key: str) -> None:
+        """Add a key to the trie"""
+        node = self._root
+        for char in key:
+            node = node.setdefault(char, {})
+        # NOTE: an empty string never collides with a single character edge
+        node[""] = key
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """Get all keys starting with the prefix"""
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        keys: List[str] = []
+        self._collect(node, keys)
+        return keys
+
+    def _collect(self, node: dict[str, Any], keys: List[str]) -> None:
+        for char, child in node.items():
+            if char == "":
+                keys.append(child)
+            else:
+                self._collect(child, keys)
+
+
+COMMAND_TRIE = PrefixTrie(COMMANDS)
 
 
 class Plugin(PluginInstance, TriggerQueryHandler):
@@ -51,6 +101,22 @@ class Plugin(PluginInstance, TriggerQueryHandler):
         PluginInstance.__init__(self)
         TriggerQueryHandler.__init__(self)
         self.controller = MPRISDBusController(DEFAULT_BUS_NAME)
+        self.command_factories: dict[str, Callable[[], Command]] = {
+            "info": self.create_info_command,
+            "play": functools.partial(self.create_static_command, "play", self.controller.play),
+            "pause": functools.partial(self.create_static_command, "pause", self.controller.pause),
+            "next": functools.partial(self.create_static_command, "next", self.controller.next_track),
+            "prev": functools.partial(self.create_static_command, "prev", self.controller.previous_track),
+            "shuffle": self.create_shuffle_command,
+            "loop": self.create_loop_command,
+            "goto": self.create_goto_command,
+            "switch": self.create_switch_command,
+            # "toggle": self.create_toggle_command,
+            # "stop": functools.partial(self.create_static_command, "stop", self.controller.stop),
+        }
+
+    def __del__(self) -> None:
+        self.controller.close()
 
     def id(self) -> str:
         return md_name
@@ -64,82 +130,64 @@ class Plugin(PluginInstance, TriggerQueryHandler):
     def defaultTrigger(self) -> str:
         return DEFAULT_TRIGGER
 
-    def create_commands(self) -> dict[str, tuple[str, str, Any, List[str]]]:
-        return {
-            "info": (
-                f"{self.controller.get_playback_status()} | {self.controller.get_title()}",
-                f"{self.controller.get_album_artist()} / {self.controller.get_album()}",
-                lambda: self.controller.play_pause(),
-                [self.controller.get_art_url(), ICONS["generic"]],
-            ),
-            "play": (
-                "Play",
-                "Play current track",
-                lambda: self.controller.play(),
-                [ICONS["play"]],
-            ),
-            "pause": (
-                "Pause",
-                "Pause current track",
-                lambda: self.controller.pause(),
-                [ICONS["pause"]],
-            ),
-            "next": (
-                "Next",
-                "Go to next track",
-                lambda: self.controller.next_track(),
-                [ICONS["next"]],
-            ),
-            "prev": (
-                "Previous",
-                "Go to previous track",
-                lambda: self.controller.previous_track(),
-                [ICONS["previous"]],
-            ),
-            "shuffle": (
-                "Shuffle",
-                f"Toggle shuffle mode ({self.controller.get_shuffle()})",
-                lambda: self.controller.set_shuffle(self.controller.get_shuffle() is False),
-                [ICONS["shuffle"]],
-            ),
-            "loop": (
-                "Loop",
-                f"Cycle loop mode ({self.controller.get_loop()})",
-                lambda: self.controller.cycle_loop(),
-                [ICONS["loop"]],
-            ),
-            "goto": (
-                "GoTo",
-                f"Go to specific position MM:SS ({self.controller.get_position_str()})",
-                lambda: None,
-                [ICONS["goto"]],
-            ),
-            "switch": (
-                "Switch",
-                f"Switch to another media player ({self.controller.get_current_bus_app()})",
-                lambda: None,
-                [ICONS["switch"]],
-            ),
-            # "toggle": (
-            #     "Toggle",
-            #     f"Toggle Play/Pause ({self.controller.get_playback_status()})",
-            #     lambda: self.controller.play_pause(),
-            #     [ICONS["play"]],
-            # ),
-            # "stop": (
-            #     "Stop",
-            #     "Stop playback",
-            #     lambda: self.controller.stop(),
-            #     [ICONS["play"]],
-            # ),
-        }
+    def create_static_command(self, cmd: str, action: Callable[[], None]) -> Command:
+        text, subtext, icons = STATIC_COMMANDS[cmd]
+        return (text, subtext, action, icons)
+
+    def create_info_command(self) -> Command:
+        return (
+            f"{self.controller.get_playback_status()} | {self.controller.get_title()}",
+            f"{self.controller.get_album_artist()} / {self.controller.get_album()}",
+            self.controller.play_pause,
+            [self.controller.get_art_url(), ICONS["generic"]],
+        )
+
+    def create_shuffle_command(self) -> Command:
+        return (
+            "Shuffle",
+            f"Toggle shuffle mode ({self.controller.get_shuffle()})",
+            lambda: self.controller.set_shuffle(self.controller.get_shuffle() is False),
+            ICON_LISTS["shuffle"],
+        )
+
+    def create_loop_command(self) -> Command:
+        return (
+            "Loop",
+            f"Cycle loop mode ({self.controller.get_loop()})",
+            self.controller.cycle_loop,
+            ICON_LISTS["loop"],
+        )
+
+    def create_goto_command(self) -> Command:
+        return (
+            "GoTo",
+            f"Go to specific position MM:SS ({self.controller.get_position_str()})",
+            lambda: None,
+            ICON_LISTS["goto"],
+        )
+
+    def create_switch_command(self) -> Command:
+        return (
+            "Switch",
+            f"Switch to another media player ({self.controller.get_current_bus_app()})",
+            lambda: None,
+            ICON_LISTS["switch"],
+        )
+
+    # def create_toggle_command(self) -> Command:
+    #     return (
+    #         "Toggle",
+    #         f"Toggle Play/Pause ({self.controller.get_playback_status()})",
+    #         self.controller.play_pause,
+    #         ICON_LISTS["play"],
+    #     )
 
     def create_player_not_running_item(self) -> StandardItem:
         return StandardItem(
             id=md_name,
             text=f"MEDIA PLAYER NOT RUNNING: {self.controller.get_current_bus_app()}",
             subtext=f"Please (re)start '{self.controller.get_current_bus_app()}' first",
-            icon_factory=lambda: iconFromUrls([ICONS["error"]]),
+            icon_factory=lambda: iconFromUrls(ICON_LISTS["error"]),
         )
 
     def create_command_item(self, cmd, text, subtext, func, icons) -> StandardItem:
@@ -156,7 +204,7 @@ class Plugin(PluginInstance, TriggerQueryHandler):
             id=f"{md_name}_{player}",
             text=f"{player}",
             subtext=f"Switch media player to '{player}'",
-            icon_factory=lambda: iconFromUrls([ICONS["generic"]]),
+            icon_factory=lambda: iconFromUrls(ICON_LISTS["generic"]),
             actions=[Action("Switch", f"{player}", lambda p=player: self.controller.activate_bus_app(p))],
         )
 
@@ -167,7 +215,7 @@ class Plugin(PluginInstance, TriggerQueryHandler):
             id=f"{md_name}_goto",
             text=f"Go to {pos}",
             subtext=f"Go to '{curr_pos}' -> '{pos}'",
-            icon_factory=lambda: iconFromUrls([ICONS["goto"]]),
+            icon_factory=lambda: iconFromUrls(ICON_LISTS["goto"]),
             actions=[Action("GoTo", f"{pos}", lambda p=pos: self.controller.set_position_str(p))],
         )
 
@@ -176,43 +224,46 @@ class Plugin(PluginInstance, TriggerQueryHandler):
         commands = {}
 
         if self.controller.is_current_bus_app_active():
-            commands = self.create_commands()
+            commands = self.command_factories
         else:
+            if not self.controller.is_current_bus_app_available():
+                self.controller.refresh_bus_names()
             if self.controller.is_current_bus_app_available():
                 self.controller.activate_current_bus_app()
-                commands = self.create_commands()
+                commands = self.command_factories
             else:
                 self.controller.deactivate_bus_app()
                 items.append(self.create_player_not_running_item())
-                commands = self.create_commands()
-                commands = {k: commands[k] for k in ["switch"]}
+                commands = {"switch": self.create_switch_command}
 
-        args = query.string.lower().strip().split(" ")
-        command = args[0] if len(args) > 0 else None
-        if command is None or command == "":
+        head, _, rest = query.string.strip().partition(" ")
+        command = head.lower()
+        args = rest.split(None, 1)
+        arg = args[0] if args else None
+        if command == "":
             # Show all commands
-            for cmd, (text, subtext, func, icons) in commands.items():
-                items.append(self.create_command_item(cmd, text, subtext, func, icons))
+            for cmd in COMMANDS:
+                if cmd in commands:
+                    items.append(self.create_command_item(cmd, *commands[cmd]()))
         else:
             if command == "switch":
+                self.controller.refresh_bus_names()
                 apps = self.controller.get_available_bus_apps()
-                app_name = args[1] if len(args) > 1 else None
-                if app_name is None:
+                if arg is None:
                     # List all players
                     for app in apps:
                         items.append(self.create_app_item(app))
                 else:
-                    # Filter player by bus_name
-                    for app in apps:
-                        if app.startswith(app_name):
-                            items.append(self.create_app_item(app))
+                    # Filter player by bus_name (case-insensitive)
+                    lowered_apps = {app.lower(): app for app in apps}
+                    for app in PrefixTrie(lowered_apps).keys(arg.lower()):
+                        items.append(self.create_app_item(lowered_apps[app]))
             elif command == "goto":
-                pos = args[1] if len(args) > 1 else None
-                items.append(self.create_goto_item(pos))
+                items.append(self.create_goto_item(arg))
             else:
                 # Filter commands based on input
-                for cmd, (text, subtext, func, icons) in commands.items():
-                    if cmd.startswith(command):
-                        items.append(self.create_command_item(cmd, text, subtext, func, icons))
+                for cmd in COMMAND_TRIE.keys(command):
+                    if cmd in commands:
+                        items.append(self.create_command_item(cmd, *commands[cmd]()))
 
         query.add(items)
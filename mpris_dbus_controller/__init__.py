@@ -1,38 +1,174 @@
-from typing import Any, Optional
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
 
 import dbus
-from dbus.mainloop.glib import DBusGMainLoop
+from dbus.mainloop.glib import DBusGMainLoop, threads_init
 
 INTERFACE = "org.mpris.MediaPlayer2.Player"
+MPRIS_PREFIX = "org.mpris.MediaPlayer2."
+MPRIS_PREFIX_LEN = len(MPRIS_PREFIX)
+PLAYER_CACHE_SIZE = 16
+POSITION_SAMPLE_TTL = 1.0  # seconds
+ASYNC_CALL_TIMEOUT = 2.0  # seconds
+SYNC_CALL_TIMEOUT = 1.0  # seconds
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+_TWO_DIGIT = [f"{i:02}" for i in range(60)]
+
+
+def _ignore_reply(*_args: Any) -> None:
+    pass
+
+
+def _format_position(position_us: int) -> str:
+    """Format a position in microseconds as MM:SS"""
+    minutes, seconds = divmod(max(int(position_us), 0) // 1_000_000, 60)
+    return f"{_TWO_DIGIT[minutes] if minutes < 60 else minutes}:{_TWO_DIGIT[seconds]}"
+
+
+def _locked(method: F) -> F:
+    """Run the method while holding the controller lock, as signals and replies arrive on the main loop thread"""
+
+    @functools.wraps(method)
+    def wrapper(self: "MPRISDBusController", *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper  # type: ignore[return-value]
+
+
+class LRUCache(Generic[K, V]):
+    """Mapping bounded to a capacity, evicting the least recently used entry first"""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Get the value of the key and mark it as recently used"""
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.capacity:
+            self._data.popitem(last=False)
 
 
 class MPRISDBusController:
     def __init__(self, bus_app: str = "spotify") -> None:
+        threads_init()
         DBusGMainLoop(set_as_default=True)
+        self._lock = threading.RLock()
         self.bus = dbus.SessionBus()
         self.bus_app = bus_app
         self.proxy = None
         self.interface = None
         self.properties = None
+        self._props_signal = None
+        self._meta_cache: Optional[dict[str, Any]] = None
+        self._props_cache: Optional[dict[str, Any]] = None
+        self._pos_sample: Optional[tuple[float, int]] = None
+        # monotonic time the pending background refresh was requested at
+        self._props_pending: Optional[float] = None
+        self._pos_pending: Optional[float] = None
+        # set when a refresh is requested while one is pending, as the pending reply predates the request
+        self._props_refresh_again = False
+        self._player_props: LRUCache[str, dict[str, Any]] = LRUCache(PLAYER_CACHE_SIZE)
+        self._mpris_names = self._list_bus_names()
+        self._names_signal = self.bus.add_signal_receiver(
+            self._on_name_owner_changed,
+            signal_name="NameOwnerChanged",
+            dbus_interface="org.freedesktop.DBus",
+            bus_name="org.freedesktop.DBus",
+            path="/org/freedesktop/DBus",
+        )
         if self.is_current_bus_app_available():
             self.activate_current_bus_app()
 
+    def close(self) -> None:
+        """Remove the signal subscriptions from the shared session bus"""
+        self.deactivate_bus_app()
+        self._names_signal.remove()
+
     # Bus Connection
-    def _get_available_bus_names(self) -> list[str]:
-        """Get a list of available media player bus names"""
+    def _list_bus_names(self) -> set[str]:
+        """List media player bus names currently owned on the session bus"""
         try:
             proxy = self.bus.get_object("org.freedesktop.DBus", "/org/freedesktop/DBus")
             interface = dbus.Interface(proxy, "org.freedesktop.DBus")
-            services = interface.ListNames()
-            names = [s for s in services if s.startswith("org.mpris.MediaPlayer2.")]
-            return [name for name in names if not (name.startswith(":") or "instance" in name)]
+            services = interface.ListNames(timeout=SYNC_CALL_TIMEOUT)
+            return {str(s) for s in services if self._is_mpris_bus_name(s)}
         except Exception as e:
             print(f"Error getting available media players: {e}")
-            return []
+            return set()
+
+    def refresh_bus_names(self) -> None:
+        """List the media player bus names again, in case NameOwnerChanged is not delivered"""
+        # NOTE: signals are only dispatched if the host iterates the default GLib main context
+        names = self._list_bus_names()
+        with self._lock:
+            self._mpris_names = names
+
+    @staticmethod
+    def _is_mpris_bus_name(name: str) -> bool:
+        """Check if the bus name belongs to a media player"""
+        return name.startswith(MPRIS_PREFIX) and not name.startswith(":") and "instance" not in name
+
+    @_locked
+    def _on_name_owner_changed(self, name: str, old_owner: str, new_owner: str) -> None:
+        """Keep the set of media player bus names in sync with the session bus"""
+        if not self._is_mpris_bus_name(name):
+            return
+        if new_owner:
+            self._mpris_names.add(str(name))
+        else:
+            self._mpris_names.discard(str(name))
+        if name == f"{MPRIS_PREFIX}{self.bus_app}" and self.proxy is not None:
+            # NOTE: the proxy is bound to the old owner, reconnect on the next query
+            self.deactivate_bus_app()
+
+    @_locked
+    def _on_properties_changed(self, interface: str, changed: dict[str, Any], invalidated: list[str]) -> None:
+        """Merge the properties changed by the player into the cached ones"""
+        if interface != INTERFACE:
+            return
+        now = time.monotonic()
+        was_playing = self._props_cache is not None and self._props_cache.get("PlaybackStatus") == "Playing"
+        if self._props_cache is not None:
+            self._props_cache.update(changed)
+            if invalidated:
+                self._request_all_props()
+        if "Metadata" in changed:
+            self._pos_sample = None
+        elif "PlaybackStatus" in changed:
+            # NOTE: re-anchor the sample at the status change, so the time spent in the new status is not
+            # interpolated as if the old one had continued until the resampled position arrives
+            if self._pos_sample is not None:
+                self._pos_sample = (now, self._interpolate_position(self._pos_sample, now, was_playing))
+            self._request_position()
+        if "Metadata" in changed or "Metadata" in invalidated:
+            self._meta_cache = None
+
+    @_locked
+    def _get_available_bus_names(self) -> list[str]:
+        """Get a list of available media player bus names"""
+        return sorted(self._mpris_names)
 
     def get_available_bus_apps(self) -> list[str]:
         """Get a list of available media player bus apps"""
-        return [name.split(".")[-1] for name in self._get_available_bus_names()]
+        return [name[MPRIS_PREFIX_LEN:] for name in self._get_available_bus_names()]
 
     def get_current_bus_app(self) -> str:
         """Get the bus app of the media player"""
@@ -40,16 +176,33 @@ class MPRISDBusController:
 
     def activate_bus_app(self, bus_app: str) -> None:
         """Set the bus name of the media player"""
+        self.deactivate_bus_app()
+        self.bus_app = bus_app
         try:
-            self.proxy = self.bus.get_object(f"org.mpris.MediaPlayer2.{self.bus_app}", "/org/mpris/MediaPlayer2")
+            bus_name = f"{MPRIS_PREFIX}{bus_app}"
+            self.proxy = self.bus.get_object(bus_name, "/org/mpris/MediaPlayer2")
             self.interface = dbus.Interface(self.proxy, INTERFACE)
             self.properties = dbus.Interface(self.proxy, "org.freedesktop.DBus.Properties")
+            self._props_signal = self.bus.add_signal_receiver(
+                self._on_properties_changed,
+                signal_name="PropertiesChanged",
+                dbus_interface="org.freedesktop.DBus.Properties",
+                path="/org/mpris/MediaPlayer2",
+                bus_name=bus_name,
+            )
+            props = self._player_props.get(bus_app)
+            if props is not None:
+                # NOTE: serve the properties seen last time for this player until they are refreshed
+                self._props_cache = props
+                self._request_all_props()
+            else:
+                self._get_all_props()
         except Exception as e:
             print(f"Error connecting to media player '{bus_app}': {e}")
 
     def is_bus_app_available(self, app: str) -> bool:
         """Check if the media player is available"""
-        return app in self.get_available_bus_apps()
+        return f"{MPRIS_PREFIX}{app}" in self._mpris_names
 
     def is_current_bus_app_available(self) -> bool:
         """Check if the current media player is available"""
@@ -68,129 +221,286 @@ class MPRISDBusController:
         self.proxy = None
         self.interface = None
         self.properties = None
+        if self._props_signal is not None:
+            self._props_signal.remove()
+            self._props_signal = None
+        if self._props_cache is not None:
+            # NOTE: keep the properties to restore them instantly when switching back to this player
+            self._player_props[self.bus_app] = self._props_cache
+        self.invalidate_cache()
+
+    # Property Cache
+    @_locked
+    def invalidate_cache(self) -> None:
+        """Drop the cached metadata, properties and position"""
+        self._meta_cache = None
+        self._props_cache = None
+        self._pos_sample = None
+        self._props_pending = None
+        self._pos_pending = None
+        self._props_refresh_again = False
+
+    def _get_all_props(self) -> dict[str, Any]:
+        """Get all player properties, fetched in a single round-trip and kept up to date by PropertiesChanged"""
+        props = self._props_cache
+        if props is not None:
+            return props
+        properties = self.properties
+        assert properties is not None
+        # NOTE: block only to prime the cache, later refreshes are asynchronous. The lock is not held
+        # while waiting, so signal handlers on the GUI thread never wait for a slow player.
+        try:
+            props = dict(properties.GetAll(INTERFACE, timeout=SYNC_CALL_TIMEOUT))
+        except dbus.DBusException as e:
+            print(f"Error getting properties of media player '{self.bus_app}': {e}")
+            return {}
+        with self._lock:
+            if self.properties is not properties:
+                return props
+            if self._props_cache is None:
+                self._props_cache = props
+            return self._props_cache
+
+    @staticmethod
+    def _is_pending(requested_at: Optional[float], now: float) -> bool:
+        """Check if a background refresh is still awaiting its reply"""
+        # NOTE: a reply that never arrived must not block later refreshes for good
+        return requested_at is not None and now - requested_at < ASYNC_CALL_TIMEOUT
+
+    @_locked
+    def _request_all_props(self) -> None:
+        """Refresh all player properties in the background, the stale cache is served meanwhile"""
+        now = time.monotonic()
+        if self.properties is None:
+            return
+        if self._is_pending(self._props_pending, now):
+            self._props_refresh_again = True
+            return
+        self._props_pending = now
+        self.properties.GetAll(
+            INTERFACE,
+            reply_handler=lambda props, bus_app=self.bus_app: self._on_all_props_reply(bus_app, props),
+            error_handler=self._on_all_props_error,
+            timeout=ASYNC_CALL_TIMEOUT,
+        )
+
+    @_locked
+    def _on_all_props_reply(self, bus_app: str, props: dict[str, Any]) -> None:
+        self._props_pending = None
+        if bus_app != self.bus_app or self._props_cache is None:
+            return
+        if props.get("Metadata") != self._props_cache.get("Metadata"):
+            self._meta_cache = None
+        self._props_cache = dict(props)
+        if self._props_refresh_again:
+            self._props_refresh_again = False
+            self._request_all_props()
+
+    @_locked
+    def _on_all_props_error(self, e: Exception) -> None:
+        self._props_pending = None
+        if self._props_refresh_again:
+            self._props_refresh_again = False
+            self._request_all_props()
+        print(f"Error getting properties of media player '{self.bus_app}': {e}")
+
+    @_locked
+    def _request_position(self) -> None:
+        """Resample the playback position in the background"""
+        now = time.monotonic()
+        if self.properties is None or self._is_pending(self._pos_pending, now):
+            return
+        self._pos_pending = now
+        self.properties.Get(
+            INTERFACE,
+            "Position",
+            reply_handler=lambda position, requested_at=now: self._on_position_reply(requested_at, position),
+            error_handler=self._on_position_error,
+            timeout=ASYNC_CALL_TIMEOUT,
+        )
+
+    @_locked
+    def _on_position_reply(self, requested_at: float, position: int) -> None:
+        # NOTE: drop replies superseded by a local write (seek, player switch) since they were requested
+        if requested_at != self._pos_pending:
+            return
+        self._pos_pending = None
+        self._pos_sample = (time.monotonic(), int(position))
+
+    @_locked
+    def _on_position_error(self, e: Exception) -> None:
+        self._pos_pending = None
+        print(f"Error getting position of media player '{self.bus_app}': {e}")
+
+    def _call_async(self, method: Any, *args: Any) -> None:
+        """Call a DBus method without waiting for its reply"""
+        method(*args, reply_handler=_ignore_reply, error_handler=self._on_call_error)
+        # NOTE: queued after the call on the same connection, so the reply reflects its effect
+        self._request_all_props()
+
+    def _on_call_error(self, e: Exception) -> None:
+        print(f"Error controlling media player '{self.bus_app}': {e}")
+
+    def _get_property(self, name: str, default: Any) -> Any:
+        """Get a player property from the cache"""
+        assert self.properties is not None
+        # NOTE: optional properties (e.g. Shuffle, LoopStatus) may not be implemented by the player
+        return self._get_all_props().get(name, default)
 
     # Playback Controls
     def play(self) -> None:
         """Start playback"""
-        if self.interface is not None:
-            self.interface.Play()
+        interface = self.interface
+        if interface is not None:
+            self._call_async(interface.Play)
 
     def pause(self) -> None:
         """Pause playback"""
-        if self.interface is not None:
-            self.interface.Pause()
+        interface = self.interface
+        if interface is not None:
+            self._call_async(interface.Pause)
 
     def play_pause(self) -> None:
         """Toggle play/pause"""
-        if self.interface is not None:
-            self.interface.PlayPause()
+        interface = self.interface
+        if interface is not None:
+            self._call_async(interface.PlayPause)
 
     def stop(self) -> None:
         """Stop playback"""
-        if self.interface is not None:
-            self.interface.Stop()
+        interface = self.interface
+        if interface is not None:
+            self._call_async(interface.Stop)
 
     def next_track(self) -> None:
         """Skip to next track"""
-        if self.interface is not None:
-            self.interface.Next()
+        interface = self.interface
+        if interface is not None:
+            self._call_async(interface.Next)
 
     def previous_track(self) -> None:
         """Go back to previous track"""
-        if self.interface is not None:
-            self.interface.Previous()
+        interface = self.interface
+        if interface is not None:
+            self._call_async(interface.Previous)
 
     # Player Status
     def get_playback_status(self) -> str:
         """Get current playback status (Playing/Paused/Stopped)"""
         if self.properties is None:
             return "Stopped"
-        return str(self.properties.Get(INTERFACE, "PlaybackStatus"))
+        return str(self._get_property("PlaybackStatus", "Stopped"))
 
     def get_position(self) -> int:
         """Get current playback position in microseconds"""
-        if self.properties is None:
+        properties = self.properties
+        if properties is None:
             return 0
-        return self.properties.Get(INTERFACE, "Position")
+        # NOTE: Position is not signaled via PropertiesChanged, so resample it in the background at
+        # most once per POSITION_SAMPLE_TTL and advance it with the local clock while playing
+        now = time.monotonic()
+        with self._lock:
+            sample = self._pos_sample
+            if sample is not None and now - sample[0] >= POSITION_SAMPLE_TTL:
+                self._request_position()
+        if sample is None:
+            # NOTE: block only when there is nothing to interpolate from (e.g. a new track), without the lock
+            try:
+                position = int(properties.Get(INTERFACE, "Position", timeout=SYNC_CALL_TIMEOUT))
+            except dbus.DBusException:
+                return 0
+            with self._lock:
+                # NOTE: a seek or player switch while waiting takes precedence
+                if self.properties is properties and self._pos_sample is None:
+                    self._pos_sample = (now, position)
+            return position
+        return self._interpolate_position(sample, now, self.get_playback_status() == "Playing")
+
+    def _interpolate_position(self, sample: tuple[float, int], now: float, playing: bool) -> int:
+        """Advance a sampled position to now with the local clock while playing"""
+        sampled_at, position = sample
+        if playing:
+            position += int((now - sampled_at) * float(self._get_property("Rate", 1.0)) * 1_000_000)
+        return position
 
     def get_position_str(self) -> str:
         """Get current playback position in human-readable format (MM:SS)"""
         metadata = self.get_metadata()
         if metadata is None:
             return "00:00:00"
-        position = self.get_position() / 1_000_000
-        minutes = int(position // 60)
-        seconds = int(position % 60)
-        return f"{minutes:02}:{seconds:02}"
+        return _format_position(self.get_position())
 
     def get_position_and_length_str(self) -> str:
         """Get current playback position/length in human-readable format (MM:SS/MM:SS)"""
         metadata = self.get_metadata()
         if metadata is None:
             return "00:00/00:00"
-        position = self.get_position() / 1_000_000
-        minutes = int(position // 60)
-        seconds = int(position % 60)
         length: Optional[Any] = metadata.get("length")
-        full_position = length / 1_000_000 if length else 0
-        full_minutes = int(full_position // 60)
-        full_seconds = int(full_position % 60)
-        return f"{minutes:02}:{seconds:02}/{full_minutes:02}:{full_seconds:02}"
+        return f"{_format_position(self.get_position())}/{_format_position(length or 0)}"
 
     def set_position(self, position) -> None:
         """Set playback position for the current track"""
-        if self.interface is None:
+        interface = self.interface
+        if interface is None:
             return
         metadata = self.get_metadata()
         if metadata is not None:
             track_id = metadata.get("track_id")
-            self.interface.SetPosition(track_id, position)
+            self._call_async(interface.SetPosition, track_id, position)
+            with self._lock:
+                self._pos_sample = (time.monotonic(), position)
+                self._pos_pending = None
 
     def set_position_str(self, position_str: str) -> None:
         """Set playback position for the current track using a human-readable format (MM:SS)"""
-        minutes, seconds = map(int, position_str.split(":"))
-        position = (minutes * 60 + seconds) * 1_000_000
+        minutes, _, seconds = position_str.partition(":")
+        position = (int(minutes) * 60 + int(seconds)) * 1_000_000
         self.set_position(position)
 
     # Playback Mode Settings
     def set_shuffle(self, shuffle_status: bool) -> None:
         """Set shuffle mode (True/False)"""
-        if self.properties is not None:
-            self.properties.Set(INTERFACE, "Shuffle", shuffle_status)
+        properties = self.properties
+        if properties is not None:
+            self._call_async(properties.Set, INTERFACE, "Shuffle", shuffle_status)
 
     def get_shuffle(self) -> bool:
         """Get current shuffle mode status"""
         if self.properties is None:
             return False
-        return bool(self.properties.Get(INTERFACE, "Shuffle"))
+        return bool(self._get_property("Shuffle", False))
 
     def set_loop(self, loop_status: str) -> None:
         """Set repeat mode (None/Track/Playlist)"""
-        if self.properties is not None:
-            self.properties.Set(INTERFACE, "LoopStatus", loop_status)
+        properties = self.properties
+        if properties is not None:
+            self._call_async(properties.Set, INTERFACE, "LoopStatus", loop_status)
 
     def get_loop(self) -> str:
         """Get current loop status"""
         if self.properties is None:
             return "None"
-        return str(self.properties.Get(INTERFACE, "LoopStatus"))
+        return str(self._get_property("LoopStatus", "None"))
 
     def cycle_loop(self) -> None:
         """Cycle repeat mode (None -> Track -> Playlist)"""
-        if self.properties is not None:
+        properties = self.properties
+        if properties is not None:
             LOOP_STATES = ["None", "Track", "Playlist"]
             loop = self.get_loop()
             loop_index = LOOP_STATES.index(loop)
             loop_status = LOOP_STATES[(loop_index + 1) % len(LOOP_STATES)]
-            self.properties.Set(INTERFACE, "LoopStatus", loop_status)
+            self._call_async(properties.Set, INTERFACE, "LoopStatus", loop_status)
 
     # Metadata Retrieval
     def get_metadata(self) -> Optional[dict[str, Any]]:
         """Get detailed information about the current track"""
         if self.properties is None:
             return None
-        metadata = self.properties.Get(INTERFACE, "Metadata")
-        return {
+        if self._meta_cache is not None:
+            return self._meta_cache
+        metadata = self._get_property("Metadata", {})
+        meta = {
             "title": str(metadata.get("xesam:title", "Unknown")),
             "artist": str(metadata.get("xesam:artist", ["Unknown"])[0]),
             "album": str(metadata.get("xesam:album", "Unknown")),
@@ -201,6 +511,11 @@ class MPRISDBusController:
             "length": int(metadata.get("mpris:length", 0)),
             "track_id": str(metadata.get("mpris:trackid", "")),
         }
+        with self._lock:
+            # NOTE: don't cache metadata replaced by a signal while it was being parsed
+            if self._props_cache is not None and self._props_cache.get("Metadata") is metadata:
+                self._meta_cache = meta
+        return meta
 
     def get_title(self) -> str:
         """Get a title of the current track metadata"""
@@ -239,6 +554,12 @@ class MPRISDBusController:
 
 
 if __name__ == "__main__":
+    # NOTE: inside Albert, the Qt event dispatcher iterates the default GLib main context and delivers DBus
+    # signals and async replies. Standalone, nothing does, so run a main loop on a background thread.
+    from gi.repository import GLib
+
+    loop = GLib.MainLoop()
+    threading.Thread(target=loop.run, daemon=True).start()
     controller = MPRISDBusController()
 
     print(f"Playback status: {controller.get_playback_status()}")
@@ -248,3 +569,5 @@ if __name__ == "__main__":
     print(f"Shuffle status: {controller.get_shuffle()}")
     print(f"Loop status: {controller.get_loop()}")
     print(f"Metadata: {controller.get_metadata()}")
+    controller.close()
+    loop.quit()